@@ -1,10 +1,15 @@
 # File: agent/agent_evaluation.py
 
 import re
+import math
+import hashlib
 import json
+from typing import Optional
 from autogen import ConversableAgent
 from config import MISTRAL_LLM_CONFIG, OPENAI_LLM_CONFIG
 from rate_limiter import RateLimiter
+from profiling import profiler
+from agent.criteria_spec import CriteriaSpec, classify_label
 
 mistral_rate_limiter = RateLimiter(max_calls=20, period_sec=60)
 openai_rate_limiter = RateLimiter(max_calls=20, period_sec=60)
@@ -53,7 +58,8 @@ Respond ONLY with a valid JSON object in the following format:
         llm_config=MISTRAL_LLM_CONFIG
     )
     try:
-        evaluation_response = critic.generate_reply(messages=[{"role": "user", "content": critic_prompt}])
+        with profiler.timed("llm"):
+            evaluation_response = critic.generate_reply(messages=[{"role": "user", "content": critic_prompt}])
         if not isinstance(evaluation_response, dict):
             print("Warning: evaluation_response is not a dict. Skipping Mistral evaluation.")
             raise ValueError("Invalid response type")
@@ -72,7 +78,8 @@ Respond ONLY with a valid JSON object in the following format:
                 name="Critic",
                 llm_config=OPENAI_LLM_CONFIG
             )
-            evaluation_response = critic.generate_reply(messages=[{"role": "user", "content": critic_prompt}])
+            with profiler.timed("llm"):
+                evaluation_response = critic.generate_reply(messages=[{"role": "user", "content": critic_prompt}])
             if not isinstance(evaluation_response, dict):
                 print("Warning: evaluation_response is not a dict from OpenAI. Skipping evaluation.")
                 raise ValueError("Invalid response type")
@@ -88,10 +95,195 @@ Respond ONLY with a valid JSON object in the following format:
             return {"error": "All LLM evaluation calls failed"}
 
 
-def build_search_query(product_type: str, criteria_summary: str) -> str:
+# Per-produkt scorer der sendes til LLM'en, og sæt-scorer der beregnes lokalt
+PRODUCT_SCORE_KEYS = ['relevance', 'detail', 'price']
+SET_SCORE_KEYS = ['comparison', 'diversity']
+
+
+def criteria_fingerprint(criteria_summary: str) -> str:
+    """
+    Fingerprint af brugerens kriterier (whitespace/case-normaliseret).
+    Ændres kriterierne, bliver alle cachede produkt-scorer ugyldige.
+    """
+    normalized = ' '.join(criteria_summary.lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def product_key(product: dict) -> str:
+    """
+    Identitet for et produkt: link hvis tilgængeligt, ellers titel + butik.
+    """
+    identity = product.get('link') or f"{product.get('title', '')}|{product.get('store', '')}"
+    return hashlib.sha1(identity.strip().lower().encode('utf-8')).hexdigest()
+
+
+def _generate_critic_json(prompt: str) -> dict:
+    """
+    Sender prompten til Critic-agenten (Mistral, fallback OpenAI) og returnerer svaret som dict.
+    Kaster ValueError hvis ingen af modellerne giver gyldig JSON.
+    """
+    for limiter, llm_config, label in (
+        (mistral_rate_limiter, MISTRAL_LLM_CONFIG, "Mistral"),
+        (openai_rate_limiter, OPENAI_LLM_CONFIG, "OpenAI"),
+    ):
+        try:
+            limiter.wait_if_needed()
+            critic = ConversableAgent(name="Critic", llm_config=llm_config)
+            with profiler.timed("llm"):
+                evaluation_response = critic.generate_reply(messages=[{"role": "user", "content": prompt}])
+            if not isinstance(evaluation_response, dict):
+                raise ValueError("Invalid response type")
+            content = evaluation_response.get("content", "{}")
+            json_match = re.search(r"\{.*\}", content, re.DOTALL)
+            if not json_match:
+                raise ValueError("No JSON found")
+            return json.loads(json_match.group())
+        except Exception as e:
+            print(f"{label} product evaluation failed:", str(e))
+    raise ValueError("All LLM evaluation calls failed")
+
+
+def _clamp_score(value) -> Optional[int]:
+    """
+    Konverterer en score fra LLM'en til int i intervallet 1-5. Returnerer None hvis den ikke kan tolkes.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        score = round(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return max(1, min(5, score))
+
+
+def _score_new_products(criteria_summary: str, products: list) -> dict:
+    """
+    Scorer kun de produkter, der ikke allerede ligger i cachen.
+    Returnerer {produkt-nøgle: {"relevance", "detail", "price", "note"}}.
+    """
+    ids = {f"p{i}": product_key(p) for i, p in enumerate(products, 1)}
+    product_lines = []
+    for i, p in enumerate(products, 1):
+        description = (p.get('description') or '')[:200]
+        product_lines.append(
+            f"p{i}: {p.get('title', 'Unknown')} | Price: {p.get('price', '-')} | "
+            f"Store: {p.get('store', '-')} | {description}"
+        )
+    products_text = "\n".join(product_lines)
+    prompt = f"""
+You are an evaluation agent. Score each product below individually against the user's criteria (rate each 1-5):
+- Relevance: Does the product match the user's needs and criteria?
+- Detail: Is there enough information (name, price, store, features) to judge the product?
+- Price: Does the price match the user's requirements (e.g., within budget)?
+
+User's criteria:
+{criteria_summary}
+
+Products:
+{products_text}
+
+Respond ONLY with a valid JSON object in the following format:
+{{
+    "products": [
+        {{"id": "p1", "relevance": int, "detail": int, "price": int, "note": string}}
+    ]
+}}
+"""
+    result = _generate_critic_json(prompt)
+    entries = result.get("products", []) if isinstance(result, dict) else []
+    scored = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        key = ids.get(str(entry.get("id")))
+        if key is None:
+            continue
+        # Ugyldige scorer springes over, så produktet scores igen ved næste forsøg
+        scores = {k: _clamp_score(entry.get(k)) for k in PRODUCT_SCORE_KEYS}
+        if None in scores.values():
+            print(f"Warning: Invalid scores for {entry.get('id')} from evaluator. Skipping.")
+            continue
+        scores["note"] = str(entry.get("note") or "")
+        scored[key] = scores
+    return scored
+
+
+def evaluate_products(criteria_summary: str, products: list, cache: dict = None, max_results: int = 5) -> dict:
+    """
+    Inkrementel evaluering: scorer hvert produkt for sig og cacher resultatet pr.
+    produkt og kriterie-fingerprint, så kun nye produkter sendes til LLM'en.
+    Diversity og comparison beregnes lokalt ud fra de cachede scorer.
+    Diversity giver fuld score, når mindst halvdelen af de ønskede resultater (max_results) er relevante.
+    cache er en dict (kriterie-fingerprint, produkt-nøgle) -> scorer, som kalderen genbruger
+    mellem forsøg; uden cache scores alle produkter på ny.
+    Returnerer samme slags dict som evaluate_response, plus "new_products" (antal nyscorede)
+    og "unscored" (produkter critic'en ikke gav gyldige scorer).
+    """
+    if cache is None:
+        cache = {}
+    fingerprint = criteria_fingerprint(criteria_summary)
+
+    # Dedupliker på produkt-identitet og find de produkter, der mangler scorer
+    unique = {}
+    for p in products:
+        unique.setdefault(product_key(p), p)
+    new_products = [p for key, p in unique.items() if (fingerprint, key) not in cache]
+
+    scored = {}
+    if new_products:
+        try:
+            scored = _score_new_products(criteria_summary, new_products)
+        except ValueError as e:
+            return {"error": str(e)}
+        for key, scores in scored.items():
+            cache[(fingerprint, key)] = scores
+    unscored = [p for key, p in unique.items() if (fingerprint, key) not in cache]
+
+    per_product = [cache[(fingerprint, key)] for key in unique if (fingerprint, key) in cache]
+    if not per_product:
+        return {"error": "No product scores returned by evaluator"}
+
+    evaluation = {
+        k: round(sum(s.get(k, 0) for s in per_product) / len(per_product), 2)
+        for k in PRODUCT_SCORE_KEYS
+    }
+
+    # Diversity: andel relevante muligheder i forhold til det ønskede antal,
+    # skaleret til 1-5 og trukket ned hvis alle er fra samme butik
+    viable = [s for s in per_product if s.get('relevance', 0) >= 3]
+    stores = {(p.get('store') or '').lower() for p in unique.values() if p.get('store')}
+    target = max(1, math.ceil(max_results / 2))
+    diversity = round(1 + 4 * min(len(viable), target) / target) - (1 if len(stores) <= 1 else 0)
+    evaluation['diversity'] = max(1, min(5, diversity))
+
+    # Comparison: detaljeniveau vægtet med andelen af produkter med pris og butik
+    comparable = [p for p in unique.values() if p.get('price') and p.get('store')]
+    avg_detail = sum(s.get('detail', 0) for s in per_product) / len(per_product)
+    comparison = round(avg_detail * len(comparable) / len(unique))
+    evaluation['comparison'] = max(1, min(5, comparison))
+
+    notes = []
+    for key, p in unique.items():
+        scores = cache.get((fingerprint, key))
+        if scores and scores.get('relevance', 0) < 4 and scores.get('note'):
+            notes.append(f"- {p.get('title', 'Unknown')}: {scores['note']}")
+    if evaluation['diversity'] < 3:
+        notes.append("- Too few relevant options; broaden the search to more products or stores.")
+    # Produkter uden gyldige scorer indgår ikke i gennemsnittet, så det skal fremgå af feedbacken
+    if unscored:
+        titles = ", ".join(p.get('title', 'Unknown') for p in unscored)
+        notes.append(f"- {len(unscored)} of {len(unique)} products could not be scored: {titles}")
+    evaluation['feedback'] = "\n".join(notes) or "All products match the criteria well."
+    evaluation['new_products'] = len(scored)
+    evaluation['unscored'] = len(unscored)
+    return evaluation
+
+
+def build_search_query(product_type: str, criteria_summary: str, spec: CriteriaSpec = None) -> str:
     """
     Bygger søgestreng på baggrund af produkt og kriterier.
     Bruges kun til første søgning, herefter optimerer vi med LLM og feedback.
+    Med en kompileret CriteriaSpec erstattes budget-, mærke- og feature-bullets af spec'ens søgeord.
     """
     # Filtrer bullets ud, undgå budget-linjer
     lines = [
@@ -105,6 +297,8 @@ def build_search_query(product_type: str, criteria_summary: str) -> str:
         clean = lin.replace('**', '')
         if ':' in clean:
             label, answer = clean.split(':', 1)
+            if spec is not None and classify_label(label.strip()) is not None:
+                continue
             answer = answer.strip()
             words = answer.split()
             keywords.append(' '.join(words[:2]))
@@ -112,6 +306,8 @@ def build_search_query(product_type: str, criteria_summary: str) -> str:
             kws = clean.lower().replace(',', '').split()
             if kws:
                 keywords.append(' '.join(kws[:2]))
+    if spec is not None:
+        keywords += spec.to_query_terms()
     seen = set()
     final = []
     for kw in keywords:
@@ -143,7 +339,8 @@ Based on the criteria and the feedback, generate an improved and concrete Google
             name="SearchOptimizer",
             llm_config=MISTRAL_LLM_CONFIG
         )
-        result = optimizer.generate_reply([{"role": "user", "content": prompt}])
+        with profiler.timed("llm"):
+            result = optimizer.generate_reply([{"role": "user", "content": prompt}])
         if isinstance(result, dict):
             search_query = result.get('content', '').strip()
         else:
@@ -157,7 +354,8 @@ Based on the criteria and the feedback, generate an improved and concrete Google
                 name="SearchOptimizer",
                 llm_config=OPENAI_LLM_CONFIG
             )
-            result = optimizer.generate_reply([{"role": "user", "content": prompt}])
+            with profiler.timed("llm"):
+                result = optimizer.generate_reply([{"role": "user", "content": prompt}])
             if isinstance(result, dict):
                 search_query = result.get('content', '').strip()
             else:
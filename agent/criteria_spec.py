@@ -0,0 +1,326 @@
+# File: agent/criteria_spec.py
+
+import re
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Valutakurser pr. 1 USD (Google Shopping-priserne kommer tilbage i USD)
+CURRENCY_PER_USD = {
+    "USD": 1.0,
+    "DKK": 7.0,
+    "EUR": 0.92,
+}
+
+# Svar der betyder at brugeren ikke har en præference (hele svaret eller en vending i det)
+NO_PREFERENCE = re.compile(
+    r"^(any|none|no|open|n/a|ingen|ligegyldigt|flexible|fleksibel)$"
+    r"|^none\b|^(not|no|ikke)\s+(really\s+)?(important|required|needed|necessary|relevant|vigtigt|nødvendigt|påkrævet)\b"
+    r"|\bno\b[\w\s]*\bpreference"
+    r"|\b(don't|dont|do not|doesn't|does not|not)\b[\w\s']*\b(prefer|preference|matter|care|picky)"
+    r"|\bno (particular|specific)\b|\bnothing (in )?particular\b"
+    r"|\bany brand|\bopen to\b|\bingen præference|\bligegyldigt|\bikke vigtigt",
+    re.IGNORECASE,
+)
+
+# Ord der efter et "no"/"not" ikke er et mærke, f.eks. "not important" eller "no particular brand"
+NON_BRAND = re.compile(
+    r"^(important|required|needed|necessary|relevant|particular|specific|preference|really|sure"
+    r"|vigtigt|nødvendigt|påkrævet|særlig)\b|\bbrands?\b|\bmærker?\b",
+    re.IGNORECASE,
+)
+
+# Ord der gør et ellers præferenceløst svar til en undtagelse, f.eks. "any brand but not Beats"
+EXCEPTION_WORDS = re.compile(r"\b(but|except|men|undtagen)\b", re.IGNORECASE)
+
+# Ord foran et mærke der betyder at det skal udelukkes
+EXCLUDE_PREFIXES = ("no ", "not ", "avoid ", "except ", "without ", "ikke ", "undgå ", "uden ")
+
+# Fyldord der fjernes foran mærker og features
+FILLER_PREFIXES = (
+    "preferably from ", "preferably ", "prefer ", "i prefer ", "ideally ", "maybe ",
+    "must have ", "should have ", "gerne ", "helst ",
+)
+FILLER_SUFFIXES = (" preferred", " is fine", " er fint")
+
+# Formuleringer der betyder at brugeren vil have billige produkter først
+CHEAP_WORDS = ("cheap", "affordable", "budget-friendly", "inexpensive", "billig", "ikke være de dyreste")
+
+LIST_SPLIT = re.compile(r",|;|/|\band\b|\bor\b|\bog\b|\beller\b", re.IGNORECASE)
+# Mærker splittes ikke på "and"/"og", så f.eks. "Bang and Olufsen" forbliver ét mærke
+BRAND_SPLIT = re.compile(r",|;|/|\bor\b|\beller\b|\bbut\b|\bmen\b", re.IGNORECASE)
+AMOUNT = r"(\d[\d.,]*)\s*(k\b|thousand\b|tusind\b)?"
+
+# Budgetter under dette beløb (i USD) giver ikke mening og ignoreres i stedet for at filtrere alt væk
+MIN_BUDGET_USD = 5
+
+
+@dataclass
+class CriteriaSpec:
+    """
+    Struktureret udgave af brugerens godkendte kriterier.
+    Kompileres én gang og bruges både i SerpAPI-kaldet og i det lokale efterfilter.
+    """
+    budget_min: Optional[float] = None
+    budget_max: Optional[float] = None
+    currency: str = "DKK"
+    required_brands: List[str] = field(default_factory=list)
+    excluded_brands: List[str] = field(default_factory=list)
+    must_have_features: List[str] = field(default_factory=list)
+    prefer_cheap: bool = False
+
+    def _to_usd(self, amount: Optional[float]) -> Optional[float]:
+        if amount is None:
+            return None
+        return amount / CURRENCY_PER_USD.get(self.currency, 1.0)
+
+    @property
+    def budget_min_usd(self) -> Optional[int]:
+        usd = self._to_usd(self.budget_min)
+        return math.floor(usd) if usd is not None else None
+
+    @property
+    def budget_max_usd(self) -> Optional[int]:
+        usd = self._to_usd(self.budget_max)
+        return math.ceil(usd) if usd is not None else None
+
+    def to_search_params(self) -> Dict:
+        """
+        Native SerpAPI Google Shopping-parametre (pris i USD og sortering).
+        """
+        params = {}
+        if self.budget_min_usd is not None:
+            params["min_price"] = self.budget_min_usd
+        if self.budget_max_usd is not None:
+            params["max_price"] = self.budget_max_usd
+        if self.prefer_cheap:
+            params["sort_by"] = 1  # 1 = pris lav til høj
+        return params
+
+    def to_query_terms(self) -> List[str]:
+        """
+        Søgeord afledt af spec'en: mærker, features og udelukkede mærker (med minus).
+        """
+        # Flere ønskede mærker er alternativer, ikke krav der alle skal opfyldes
+        brands = [f'"{b}"' if ' ' in b else b for b in self.required_brands[:3]]
+        terms = [' OR '.join(brands)] if brands else []
+        terms += [' '.join(f.split()[:3]) for f in self.must_have_features[:3]]
+        terms += [f'-"{b}"' if ' ' in b else f"-{b}" for b in self.excluded_brands]
+        return terms
+
+
+def classify_label(label: str) -> Optional[str]:
+    """
+    Hvilken del af spec'en en bullet-label hører til: "budget", "brand", "feature" eller None.
+    """
+    label = label.lower()
+    if 'budget' in label or label.startswith(('price', 'pris')):
+        return "budget"
+    if 'brand' in label or 'mærke' in label:
+        return "brand"
+    if 'feature' in label or 'funktion' in label or 'must' in label:
+        return "feature"
+    return None
+
+
+def mentions(text: str, term: str) -> bool:
+    """
+    Om term optræder som hele ord i text (så "HP" ikke matcher "Whip").
+    """
+    return re.search(r"(?<!\w)" + re.escape(term.lower()) + r"(?!\w)", (text or "").lower()) is not None
+
+
+def _bullets(criteria_summary: str) -> List[tuple]:
+    """
+    Returnerer (label, svar) for hver bullet. Label er tom hvis linjen ikke har kolon.
+    """
+    result = []
+    for lin in criteria_summary.splitlines():
+        if not lin.strip().startswith(('-', '*')):
+            continue
+        clean = lin.strip().strip('-* ').replace('**', '').strip()
+        if ':' in clean:
+            label, answer = clean.split(':', 1)
+            result.append((label.strip().lower(), answer.strip()))
+        else:
+            result.append(("", clean))
+    return result
+
+
+def _parse_amount(number: str, thousands: Optional[str] = None) -> Optional[float]:
+    # "1.000" og "1,000" er tusindtalsseparatorer, "29.99" er decimaler
+    cleaned = re.sub(r"[.,](?=\d{3}\b)", "", number).replace(',', '.').rstrip('.')
+    try:
+        amount = float(cleaned)
+    except ValueError:
+        return None
+    return amount * 1000 if thousands else amount
+
+
+def _parse_currency(text: str) -> Optional[str]:
+    low = text.lower()
+    if '$' in low or re.search(r"\busd\b|dollar", low):
+        return "USD"
+    if '€' in low or re.search(r"\beur\b|euro", low):
+        return "EUR"
+    if re.search(r"\bkr\b|kr\.|\bdkk\b|kroner", low):
+        return "DKK"
+    return None
+
+
+def _parse_budget(text: str) -> tuple:
+    """
+    Finder (min, maks) i en budgettekst. Ét tal tolkes som maks, medmindre
+    teksten siger "at least"/"over" o.l. "k"/"thousand"/"tusind" ganger med 1000.
+    """
+    low = text.lower()
+    range_match = re.search(AMOUNT + r"\s*(?:-|–|to|til|and|og)\s*\$?\s*" + AMOUNT, low)
+    if range_match:
+        low_amount = _parse_amount(range_match.group(1), range_match.group(2))
+        high_amount = _parse_amount(range_match.group(3), range_match.group(4))
+        # "2 to 3 thousand": tusind-suffikset gælder også det første tal
+        if (low_amount is not None and high_amount is not None and range_match.group(4)
+                and not range_match.group(2) and low_amount * 1000 <= high_amount):
+            low_amount *= 1000
+        if low_amount is not None and high_amount is not None:
+            return min(low_amount, high_amount), max(low_amount, high_amount)
+    single = re.search(AMOUNT, low)
+    if not single:
+        return None, None
+    amount = _parse_amount(single.group(1), single.group(2))
+    if re.search(r"at least|minimum|\bmin\b|\bover\b|above|mindst", low):
+        return amount, None
+    return None, amount
+
+
+def _is_no_preference(text: str) -> bool:
+    return NO_PREFERENCE.search(text.strip(' .!')) is not None
+
+
+def _strip_filler(item: str) -> str:
+    item = item.strip(' .!')
+    for prefix in FILLER_PREFIXES:
+        if item.lower().startswith(prefix):
+            item = item[len(prefix):].strip()
+    for suffix in FILLER_SUFFIXES:
+        if item.lower().endswith(suffix):
+            item = item[:-len(suffix)].strip()
+    return item
+
+
+def _split_list(answer: str) -> List[str]:
+    if _is_no_preference(answer):
+        return []
+    items = []
+    for part in LIST_SPLIT.split(answer):
+        item = _strip_filler(part)
+        if item and not _is_no_preference(item):
+            items.append(item)
+    return items
+
+
+def _parse_brands(label: str, answer: str, spec: CriteriaSpec):
+    """
+    Fordeler mærkerne i et svar på required/excluded. Et "not"/"avoid" gælder
+    resten af listen, så "avoid HP, LG" udelukker begge.
+    """
+    # Hele svaret tjekkes først, så "Not important" ikke bliver til mærket "important"
+    if _is_no_preference(answer) and not EXCEPTION_WORDS.search(answer):
+        return
+    excluding = any(w in label for w in ('avoid', 'exclude', 'undgå'))
+    for part in BRAND_SPLIT.split(answer):
+        item = part.strip(' .!')
+        if not item or _is_no_preference(item):
+            continue
+        prefix = next((p for p in EXCLUDE_PREFIXES if item.lower().startswith(p)), None)
+        if prefix:
+            item = item[len(prefix):].strip()
+            if NON_BRAND.search(item):
+                continue
+            excluding = True
+        name = _strip_filler(item)
+        # Fritekst (mere end tre ord) er næppe et mærke og må ikke ende i søgningen
+        if not name or len(name.split()) > 3:
+            continue
+        if excluding:
+            spec.excluded_brands.append(name)
+        else:
+            spec.required_brands.append(name)
+
+
+def compile_criteria(criteria_summary: str) -> CriteriaSpec:
+    """
+    Kompilerer kriterie-bullets fra dialogen til en CriteriaSpec.
+    Ukendte bullets ignoreres; mangler et budget, er budget_min/budget_max None.
+    """
+    spec = CriteriaSpec()
+    budget_text = ""
+    for label, answer in _bullets(criteria_summary):
+        kind = classify_label(label)
+        has_number = re.search(r"\d", answer) is not None
+        # Kun en budget/pris-label med et tal tæller som budget; første gyldige vinder
+        if kind == "budget":
+            if has_number and not budget_text:
+                budget_text = answer
+        elif kind == "brand":
+            _parse_brands(label, answer, spec)
+        elif kind == "feature":
+            spec.must_have_features.extend(_split_list(answer))
+        elif not label and has_number and not budget_text and re.search(r"\bbudget\b(?!-)", answer, re.IGNORECASE):
+            # Bullet uden label, f.eks. "My budget is 30 dollars"
+            budget_text = answer
+        if any(w in f"{label} {answer}".lower() for w in CHEAP_WORDS):
+            spec.prefer_cheap = True
+
+    if budget_text:
+        spec.budget_min, spec.budget_max = _parse_budget(budget_text)
+        spec.currency = _parse_currency(budget_text) or "DKK"
+        if spec.budget_max_usd is not None and spec.budget_max_usd < MIN_BUDGET_USD:
+            print(f"Warning: Ignoring implausible budget '{budget_text}'.")
+            spec.budget_min = spec.budget_max = None
+        elif spec.budget_min_usd is not None and spec.budget_min_usd < 1:
+            spec.budget_min = None
+    return spec
+
+
+def parse_usd_price(product: Dict) -> Optional[float]:
+    price = product.get("price", "")
+    if isinstance(price, str) and price.strip().startswith('$'):
+        try:
+            return float(price.strip().replace('$', '').replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+
+def _product_text(product: Dict) -> str:
+    # Titel, beskrivelse og specs samlet, så features kan findes i alle felter
+    return " ".join(str(product.get(k) or "") for k in ("title", "description", "attributes"))
+
+
+def filter_products(products: List[Dict], spec: CriteriaSpec) -> List[Dict]:
+    """
+    Lokalt efterfilter: budget og udelukkede mærker er hårde krav.
+    Ønskede mærker og must-have features er bløde – matcher ingen produkter, beholdes de alle.
+    """
+    min_usd, max_usd = spec.budget_min_usd, spec.budget_max_usd
+    result = []
+    for p in products:
+        price = parse_usd_price(p)
+        if price is not None:
+            if max_usd is not None and price > max_usd:
+                continue
+            if min_usd is not None and price < min_usd:
+                continue
+        if any(mentions(p.get("title"), b) for b in spec.excluded_brands):
+            continue
+        result.append(p)
+    if spec.required_brands:
+        preferred = [p for p in result if any(mentions(p.get("title"), b) for b in spec.required_brands)]
+        if preferred:
+            result = preferred
+    if spec.must_have_features:
+        preferred = [p for p in result if any(mentions(_product_text(p), f) for f in spec.must_have_features)]
+        if preferred:
+            result = preferred
+    return result
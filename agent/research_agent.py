@@ -2,8 +2,7 @@
 
 import os
 import sys
-import math
-import re
+import argparse
 from dotenv import load_dotenv
 
 # Load environment variables and set module path
@@ -13,14 +12,19 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from tools.product_search import search_products
 from agent.agent_evaluation import (
     evaluate_response,
+    evaluate_products,
+    PRODUCT_SCORE_KEYS,
+    SET_SCORE_KEYS,
     build_search_query,
     optimize_search_query_llm
 )
+from agent.criteria_spec import CriteriaSpec, CURRENCY_PER_USD, compile_criteria, filter_products, parse_usd_price
 from config import MISTRAL_LLM_CONFIG, OPENAI_LLM_CONFIG
+from profiling import profiler, profiled, parse_modes
 from autogen import AssistantAgent, UserProxyAgent
 
 # Conversion rate
-USD_TO_DKK_RATE = 7.0
+USD_TO_DKK_RATE = CURRENCY_PER_USD["DKK"]
 
 
 def usd_to_dkk(usd: float) -> int:
@@ -63,7 +67,8 @@ def format_products(products: list) -> str:
 
 
 def get_product_type() -> str:
-    query = input("Hvad søger du efter? (f.eks. 'day cream', 'laptop', 'TV'):\n> ").strip()
+    with profiler.timed("input"):
+        query = input("Hvad søger du efter? (f.eks. 'day cream', 'laptop', 'TV'):\n> ").strip()
     return query
 
 
@@ -110,7 +115,9 @@ def collect_user_criteria(product_type: str) -> str:
                 max_turns=2
             )
 
-    chat_result = chat_fallback(system_prompt)
+    # Dialogen blander LLM-kald og brugerinput, så den tælles for sig
+    with profiler.timed("dialog"):
+        chat_result = chat_fallback(system_prompt)
     last_reply = chat_result.summary
     print("\n" + "-" * 80)
     print(last_reply)
@@ -128,42 +135,44 @@ def collect_user_criteria(product_type: str) -> str:
     return criteria_summary
 
 
-def extract_budget_usd_from_criteria(criteria_summary):
-    match = re.search(r"budget[^0-9]*([\d]+)", criteria_summary.lower())
-    if match:
-        try:
-            budget_dkk = float(match.group(1))
-            return math.ceil(budget_dkk / USD_TO_DKK_RATE)
-        except:
-            return 400
+def extract_budget_usd_from_criteria(criteria_summary, spec: CriteriaSpec = None):
+    if spec is None:
+        spec = compile_criteria(criteria_summary)
+    if spec.budget_max_usd is not None:
+        return spec.budget_max_usd
     return 400
 
 
-def run_product_loop(product_type: str, criteria_summary: str, budget_usd: int, max_tries: int = 8, min_avg_score: float = 4.0):
+@profiled("run_product_loop")
+def run_product_loop(product_type: str, criteria_summary: str, budget_usd: int, max_tries: int = 8, min_avg_score: float = 4.0,
+                     per_product_eval: bool = False, spec: CriteriaSpec = None, max_results: int = 5):
+    # Ved per-produkt evaluering caches scorer mod de oprindelige kriterier,
+    # så feedback der tilføjes undervejs ikke ugyldiggør cachen
+    base_criteria = criteria_summary
+    # Per-produkt scorer genbruges kun inden for denne søgning
+    product_score_cache = {}
     final_products = []
     best_avg_score = 0.0
     best_filtered = []
     last_feedback = ""
     for attempt in range(1, max_tries + 1):
+        # Diff af hukommelsen siden forrige forsøg (kun med profilering af "mem")
+        profiler.snapshot(f"før forsøg {attempt}")
         print(f"\n=== Forsøg {attempt} på produkt-search og evaluering ===\n")
         if attempt == 1 or not last_feedback:
-            search_query = build_search_query(product_type, criteria_summary)
+            search_query = build_search_query(product_type, criteria_summary, spec)
         else:
             print("\n🔁 Forbedrer søgestrengen med LLM baseret på feedback...\n")
             search_query = optimize_search_query_llm(product_type, criteria_summary, last_feedback)
-        print(f"🔎 Søger efter: “{search_query}” (max USD {budget_usd})\n")
-        raw_products = search_products(search_query, max_results=5)
-
-        def parse_usd_price(p):
-            price = p.get("price", "")
-            if isinstance(price, str) and price.startswith('$'):
-                try:
-                    return float(price.replace('$', '').replace(',', ''))
-                except:
-                    return None
-            return None
-
-        filtered = [p for p in raw_products if (parse_usd_price(p) is None or parse_usd_price(p) <= budget_usd)]
+        if spec is not None:
+            # Budget/sortering skubbes ned i SerpAPI-kaldet og efterfiltreres lokalt
+            print(f"🔎 Søger efter: “{search_query}” (filtre: {spec.to_search_params()})\n")
+            raw_products = search_products(search_query, max_results=max_results, filters=spec.to_search_params())
+            filtered = filter_products(raw_products, spec)
+        else:
+            print(f"🔎 Søger efter: “{search_query}” (max USD {budget_usd})\n")
+            raw_products = search_products(search_query, max_results=max_results)
+            filtered = [p for p in raw_products if (parse_usd_price(p) is None or parse_usd_price(p) <= budget_usd)]
         if not filtered:
             print("⚠️ Ingen produkter fundet inden for budgettet. Stopper.\n")
             sys.exit(0)
@@ -172,17 +181,24 @@ def run_product_loop(product_type: str, criteria_summary: str, budget_usd: int,
         print("🛍️ Fundne produkter (sorteret fra billigst til dyrest):\n")
         print(formatted_text)
 
-        evaluation = evaluate_response(criteria_summary, formatted_text)
+        if per_product_eval:
+            evaluation = evaluate_products(base_criteria, filtered, cache=product_score_cache, max_results=max_results)
+            score_keys = PRODUCT_SCORE_KEYS + SET_SCORE_KEYS
+        else:
+            evaluation = evaluate_response(criteria_summary, formatted_text)
+            score_keys = ['relevance','comparison','explanation','detail','robustness','usability','diversity','price']
         if "error" in evaluation:
             print("\n🔍 Evaluator-agenten fejlede:", evaluation["error"])
             final_products = filtered
             break
 
-        score_keys = ['relevance','comparison','explanation','detail','robustness','usability','diversity','price']
         scores = [evaluation.get(k, 0) for k in score_keys]
         avg_score = sum(scores) / len(scores)
 
         print("\n🔍 Evaluering af fundne produkter:")
+        if per_product_eval:
+            print(f"  (nye produkter scoret: {evaluation.get('new_products')} af {len(filtered)}, "
+                  f"uden score: {evaluation.get('unscored')})")
         for key in score_keys:
             print(f"  * {key.capitalize():<10}: {evaluation.get(key)}")
         print(f"\n  Feedback:\n{evaluation.get('feedback')}\n")
@@ -202,6 +218,7 @@ def run_product_loop(product_type: str, criteria_summary: str, budget_usd: int,
     else:
         print(f"🚩 Maks. forsøg nået – bruger bedste fund med gennemsnitsscore {best_avg_score:.2f}.\n")
         final_products = best_filtered
+    profiler.snapshot("efter sidste forsøg")
     return final_products
 
 
@@ -229,12 +246,14 @@ def final_comparison_and_recommendation(products: list, criteria_summary: str):
     )
     assistant = AssistantAgent(name="FinalRecommender", llm_config=OPENAI_LLM_CONFIG)
     user_proxy = UserProxyAgent(name="User", human_input_mode="TERMINATE", code_execution_config={"use_docker": False})
-    chat = user_proxy.initiate_chat(assistant, message=prompt, summary_method=None, max_turns=4)
+    with profiler.timed("llm"):
+        chat = user_proxy.initiate_chat(assistant, message=prompt, summary_method=None, max_turns=4)
     print("\n" + "-"*80)
     print(chat.summary)
     print("\n" + "-"*80)
 
 
+@profiled("main")
 def main():
     product_type = get_product_type()
     criteria_summary = collect_user_criteria(product_type)
@@ -242,15 +261,40 @@ def main():
     print("Your criteria summary:")
     print(criteria_summary.strip())
     print("-"*80 + "\n")
-    confirm = input("Approve and start search? (yes to continue):\n> ").strip().lower()
+    with profiler.timed("input"):
+        confirm = input("Approve and start search? (yes to continue):\n> ").strip().lower()
     if confirm != 'yes':
         print("Search cancelled. Please restart and adjust your criteria if needed.")
         sys.exit(0)
 
-    budget_usd = extract_budget_usd_from_criteria(criteria_summary)
-    final_products = run_product_loop(product_type, criteria_summary, budget_usd, max_tries=8, min_avg_score=4.0)
+    spec = compile_criteria(criteria_summary)
+    budget_usd = extract_budget_usd_from_criteria(criteria_summary, spec)
+    final_products = run_product_loop(product_type, criteria_summary, budget_usd, max_tries=8, min_avg_score=4.0,
+                                      per_product_eval=True, spec=spec)
     final_comparison_and_recommendation(final_products, criteria_summary)
 
 
+def profile_modes(value: str) -> str:
+    # Validerer --profile, så en tastefejl giver en argparse-fejl i stedet for en traceback
+    try:
+        parse_modes(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Intelligent shopping assistant")
+    parser.add_argument("--profile", metavar="MODES", type=profile_modes,
+                        help="Slå profilering til: cpu, sample, mem, time, all (kommasepareret). Overskriver SHOP_PROFILE.")
+    parser.add_argument("--profile-dir", metavar="DIR", help="Mappe til profil-filer (standard: profiles)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.profile is not None:
+        profiler.configure(args.profile, args.profile_dir)
+    elif args.profile_dir:
+        profiler.output_dir = args.profile_dir
     main()
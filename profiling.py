@@ -0,0 +1,237 @@
+import os # Læser miljøvariabler (SHOP_PROFILE, SHOP_PROFILE_DIR)
+import sys # Giver adgang til stack frames for den samplende profiler
+import time # Måler vægurstid og CPU-tid
+import cProfile # Deterministisk CPU-profilering
+import threading # Baggrundstråd til sampling
+import tracemalloc # Hukommelses-snapshots
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+# Miljøvariabler til at slå profilering til uden at ændre kode, f.eks. SHOP_PROFILE=cpu,mem,time
+PROFILE_ENV = "SHOP_PROFILE"
+PROFILE_DIR_ENV = "SHOP_PROFILE_DIR"
+
+# Gyldige modes: cpu (cProfile -> .prof), sample (sampling -> .folded flamegraph-format),
+# mem (tracemalloc-diff pr. forsøg) og time (fordeling af vægurstid på CPU, netværk, rate limiter osv.)
+ALL_MODES = ("cpu", "sample", "mem", "time")
+DEFAULT_MODES = ("cpu", "mem", "time")
+
+
+def parse_modes(value: str, strict: bool = True) -> set:
+    """
+    Oversætter f.eks. "cpu,mem" eller "1"/"all" til et sæt af modes. Tom streng slår profilering fra.
+    Ukendte modes giver ValueError, eller en advarsel og ignoreres når strict=False.
+    """
+    if not value:
+        return set()
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return set(DEFAULT_MODES)
+    if value == "all":
+        return set(ALL_MODES)
+    modes = {m.strip() for m in value.split(",") if m.strip()}
+    unknown = modes - set(ALL_MODES)
+    if unknown:
+        message = f"Unknown profiling mode(s): {', '.join(sorted(unknown))} (valid: {', '.join(ALL_MODES)}, all)"
+        if strict:
+            raise ValueError(message)
+        print(f"Warning: {message}. Ignoring.")
+    return modes - unknown
+
+
+# Samplende profiler, der med et fast interval læser målets stack og tæller "foldede" stacks
+class StackSampler:
+
+    def __init__(self, thread_id: int, interval_sec: float = 0.005):
+        self.thread_id = thread_id # Tråden der skal samples (typisk hovedtråden)
+        self.interval_sec = interval_sec
+        self.counts = Counter() # "modul:funktion;modul:funktion" -> antal samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def write_folded(self, path: str):
+        # Formatet "stack antal" kan læses af flamegraph.pl, speedscope og inferno
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Profiler der samler CPU-profiler, hukommelses-diffs og tidsfordeling for en session
+class Profiler:
+
+    def __init__(self, modes: set = None, output_dir: str = "profiles"):
+        self.modes = set(modes or ())
+        self.output_dir = output_dir
+        self._depth = 0 # Kun den yderste session starter/stopper profilerne
+        self._lock = threading.Lock()
+        self._reset()
+
+    @classmethod
+    def from_env(cls):
+        # En tastefejl i miljøvariablen må ikke få alle imports af modulet til at fejle
+        return cls(parse_modes(os.getenv(PROFILE_ENV, ""), strict=False), os.getenv(PROFILE_DIR_ENV, "profiles"))
+
+    def configure(self, modes: str, output_dir: str = None):
+        """
+        Slår profilering til/fra fra f.eks. et CLI-flag. Overskriver miljøvariablen.
+        """
+        self.modes = parse_modes(modes)
+        if output_dir:
+            self.output_dir = output_dir
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.modes)
+
+    def _reset(self):
+        self.timings = defaultdict(float) # kategori -> sekunder (vægurstid)
+        self._timed_cpu = 0.0 # CPU-tid brugt inde i timed()-blokke, trækkes fra den lokale CPU-tid
+        self._thread_id = threading.get_ident() # Tråden hvis CPU-tid måles
+        self._cprofile = None
+        self._sampler = None
+        self._last_snapshot = None
+        self._wall_start = 0.0
+        self._cpu_start = 0.0
+
+    @contextmanager
+    def session(self, name: str):
+        """
+        Profilerer kodeblokken. Indlejrede sessioner (f.eks. run_product_loop inde i main) indgår i den yderste.
+        """
+        if not self.enabled or self._depth > 0:
+            self._depth += 1
+            try:
+                yield self
+            finally:
+                self._depth -= 1
+            return
+
+        self._depth += 1
+        self._reset()
+        base = None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            base = os.path.join(self.output_dir, f"{name}-{stamp}")
+
+            if "mem" in self.modes:
+                tracemalloc.start()
+                self._last_snapshot = tracemalloc.take_snapshot()
+            if "sample" in self.modes:
+                self._sampler = StackSampler(threading.get_ident())
+                self._sampler.start()
+            if "cpu" in self.modes:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+            self._wall_start = time.perf_counter()
+            self._cpu_start = time.thread_time()
+            yield self
+        finally:
+            # Køres også hvis opsætningen fejler, så _depth og profilerne altid ryddes op
+            self._depth -= 1
+            self._finish(name, base)
+
+    def _finish(self, name: str, base: str):
+        wall = time.perf_counter() - self._wall_start if self._wall_start else 0.0
+        cpu = time.thread_time() - self._cpu_start if self._cpu_start else 0.0
+        print("\n" + "-" * 80)
+        print(f"⏱️ Profilering af '{name}':")
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            if base:
+                self._cprofile.dump_stats(base + ".prof")
+                print(f"  CPU-profil (cProfile): {base}.prof")
+        if self._sampler is not None:
+            self._sampler.stop()
+            if base:
+                self._sampler.write_folded(base + ".folded")
+                print(f"  Sampling-profil (flamegraph): {base}.folded")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  Hukommelse: {current / 1024:.0f} KiB nu, {peak / 1024:.0f} KiB peak")
+        if "time" in self.modes and self._wall_start:
+            self._print_timings(wall, cpu)
+        print("-" * 80 + "\n")
+
+    @contextmanager
+    def timed(self, category: str):
+        """
+        Tilskriver vægurstiden i blokken til en kategori, f.eks. "network", "llm" eller "ratelimit".
+        Gør intet, hvis "time" ikke er slået til, eller blokken kører i en anden tråd end sessionen
+        (så fordelingen altid summerer til sessionens vægurstid).
+        """
+        if "time" not in self.modes or threading.get_ident() != self._thread_id:
+            yield
+            return
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.timings[category] += time.perf_counter() - start
+                # CPU-arbejde under I/O (SSL, JSON, autogen) hører til kategorien, ikke til "cpu"
+                self._timed_cpu += time.thread_time() - cpu_start
+
+    def snapshot(self, label: str, top: int = 10):
+        """
+        Tager et tracemalloc-snapshot og udskriver de største ændringer siden sidste snapshot.
+        """
+        if "mem" not in self.modes or not tracemalloc.is_tracing():
+            return
+        snapshot = tracemalloc.take_snapshot()
+        if self._last_snapshot is not None:
+            stats = snapshot.compare_to(self._last_snapshot, "lineno")
+            print(f"\n🧠 Hukommelsesændring ({label}):")
+            for stat in stats[:top]:
+                print(f"  {stat}")
+        self._last_snapshot = snapshot
+
+    def _print_timings(self, wall: float, cpu: float):
+        # Kategorierne, lokal CPU og "other" summerer til vægurstiden:
+        # "cpu" er sessionstrådens CPU-tid uden for timed()-blokkene, "other" er resten (ikke-målt ventetid)
+        waited = sum(self.timings.values())
+        local_cpu = max(0.0, cpu - self._timed_cpu)
+        rows = sorted(self.timings.items(), key=lambda kv: -kv[1])
+        rows += [("cpu", local_cpu), ("other", wall - waited - local_cpu)]
+        print(f"  Vægurstid: {wall:.2f}s")
+        for category, seconds in rows:
+            share = seconds / wall if wall else 0.0
+            print(f"    {category:<10}: {seconds:7.2f}s ({share:.0%})")
+
+
+# Fælles profiler for hele programmet, styret af SHOP_PROFILE
+profiler = Profiler.from_env()
+
+
+def profiled(name: str):
+    """
+    Decorator der kører funktionen i en profiler-session (no-op når profilering er slået fra).
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with profiler.session(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,6 +1,7 @@
 
 import time # Bruges til at måle tid og sætte programmet til at sove i et antal sekunder.
 from threading import Lock # Bruges til at sikre, at kode, der bruger fælles data, ikke bliver kørt af flere tråde på samme tid.
+from profiling import profiler # Tilskriver søvn-tiden til "ratelimit", når profilering er slået til
 
 # RateLimiter klasse til at begrænse antallet af kald over en given periode
 class RateLimiter:
@@ -30,7 +31,8 @@ class RateLimiter:
                     print(f"RateLimiter: Sleeping for {to_wait:.2f} seconds to respect rate limit")
                 
                 # Sover i det nødvendige antal sekunder
-                time.sleep(to_wait)
+                with profiler.timed("ratelimit"):
+                    time.sleep(to_wait)
 
                 # Tilføjer det nuværende tidsstempel til listen over kald
             self.call_timestamps.append(time.time())
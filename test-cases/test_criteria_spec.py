@@ -0,0 +1,95 @@
+from agent.criteria_spec import compile_criteria, filter_products
+
+"""
+  This test demonstrates how approved criteria bullets are compiled into a
+  CriteriaSpec, and how the spec is used as SerpAPI filters and as a local post-filter.
+
+  Expected behavior:
+  - The budget is parsed with its currency and converted to USD for SerpAPI.
+  - "Dell or Lenovo, not Apple" becomes required and excluded brands.
+  - Products over budget or from excluded brands are removed locally.
+  """
+
+criteria_summary = """- Type: laptop for graphic design
+- Important features: 16GB RAM, SSD storage and good display
+- Budget: under 7.000 kr.
+- Brand preferences: Dell or Lenovo, not Apple
+"""
+
+mock_products = [
+    {"title": "Dell XPS 15", "price": "$950", "store": "Dell"},
+    {"title": "Lenovo Yoga Pro", "price": "$1,200", "store": "Best Buy"},
+    {"title": "Apple MacBook Air", "price": "$899", "store": "Apple"},
+    {"title": "HP Envy", "price": "$700", "store": "HP"},
+]
+
+
+def test_criteria_spec():
+    spec = compile_criteria(criteria_summary)
+    print("Spec:", spec)
+    print("SerpAPI params:", spec.to_search_params())
+    print("Query terms:", spec.to_query_terms())
+
+    assert spec.currency == "DKK"
+    assert spec.to_search_params() == {"max_price": 1000}  # 7000 DKK / 7
+    assert spec.required_brands == ["Dell", "Lenovo"]
+    assert spec.excluded_brands == ["Apple"]
+
+    filtered = filter_products(mock_products, spec)
+    print("Filtered:", [p["title"] for p in filtered])
+    assert [p["title"] for p in filtered] == ["Dell XPS 15"]
+    print("Test done.")
+
+
+def test_criteria_spec_edge_cases():
+    # "budget" i en anden bullet må ikke overskrive det rigtige budget
+    spec = compile_criteria("- Important features: budget-friendly, Bluetooth\n- Budget: 700 kr\n")
+    assert spec.budget_max == 700 and "Bluetooth" in spec.must_have_features
+
+    # Budget-bullet uden tal overskriver ikke en senere med tal
+    spec = compile_criteria("- Budget: flexible\n- Price range: 300-500 kr\n")
+    assert (spec.budget_min, spec.budget_max) == (300, 500)
+
+    # Beløb med "thousand"/"tusind", og urimelige budgetter ignoreres
+    spec = compile_criteria("- Budget: between 2 and 3 thousand kroner\n")
+    assert (spec.budget_min, spec.budget_max) == (2000, 3000)
+    assert compile_criteria("- Budget: 10 kr\n").to_search_params() == {}
+
+    # Et "avoid" gælder resten af listen, og fritekst bliver ikke til et mærke
+    assert compile_criteria("- Brands: avoid HP, LG\n").excluded_brands == ["HP", "LG"]
+    spec = compile_criteria("- Brand: I don't really have a preference\n")
+    assert spec.required_brands == [] and spec.excluded_brands == []
+    spec = compile_criteria("- Brand: Bang and Olufsen or Sony, not Beats\n")
+    assert spec.required_brands == ["Bang and Olufsen", "Sony"] and spec.excluded_brands == ["Beats"]
+
+    # Mærker matches på hele ord
+    products = [{"title": "Whip cream", "price": "$5"}, {"title": "HP Envy", "price": "$500"}]
+    spec = compile_criteria("- Brands: avoid HP\n")
+    assert [p["title"] for p in filter_products(products, spec)] == ["Whip cream"]
+    products = [{"title": "Algae shampoo", "price": "$5"}, {"title": "Bulgarian yogurt maker", "price": "$30"}]
+    assert len(filter_products(products, compile_criteria("- Brand: LG\n"))) == 2
+
+    # Svar uden præference bliver hverken til mærker eller features
+    for answer in ("Not important", "No particular brand", "None specified", "None in particular", "Flexible"):
+        spec = compile_criteria(f"- Brand preferences: {answer}\n")
+        assert spec.required_brands == [] and spec.excluded_brands == [], answer
+        assert spec.to_query_terms() == [], answer
+    assert compile_criteria("- Important features: Not required\n").must_have_features == []
+    assert compile_criteria("- Brand: any brand but not Beats\n").excluded_brands == ["Beats"]
+
+    # Flere ønskede mærker er alternativer i søgningen
+    spec = compile_criteria("- Brand preferences: Dell or Lenovo, not Apple\n")
+    assert spec.to_query_terms() == ["Dell OR Lenovo", "-Apple"]
+
+    # Features er et blødt filter over titel, beskrivelse og specs
+    spec = compile_criteria("- Important features: Bluetooth\n")
+    products = [{"title": "Speaker A", "price": "$20", "attributes": {"Connectivity": "Bluetooth"}},
+                {"title": "Speaker B", "price": "$15", "description": "Wired speaker"}]
+    assert [p["title"] for p in filter_products(products, spec)] == ["Speaker A"]
+    assert len(filter_products(products[1:], spec)) == 1
+    print("Edge cases done.")
+
+
+if __name__ == "__main__":
+    test_criteria_spec()
+    test_criteria_spec_edge_cases()
@@ -0,0 +1,93 @@
+import re
+import agent.agent_evaluation as agent_evaluation
+from agent.agent_evaluation import evaluate_products
+
+"""
+  This test demonstrates the incremental per-product evaluation (evaluate_products)
+  with a stubbed critic, so no LLM calls are made.
+
+  Expected behavior:
+  - Only products that are not already cached are sent to the critic.
+  - Changing the criteria invalidates the cache, so all products are scored again.
+  - Invalid scores from the critic are converted/clamped or skipped and never cached.
+  - Diversity and comparison are computed locally from the cached scores.
+  """
+
+criteria_summary = "- Type: night cream\n- Budget: 200 kr.\n"
+
+mock_products = [
+    {"title": "La Roche-Posay Night", "price": "$25", "store": "Matas", "link": "https://example.com/1"},
+    {"title": "Vichy Aqualia Night", "price": "$22", "store": "Apopro", "link": "https://example.com/2"},
+]
+
+new_product = {"title": "Avene Hydrance Night", "price": "$19", "store": "Apoteket", "link": "https://example.com/3"}
+
+sent_prompts = []
+
+
+# Stub af critic'en: giver relevance 4, detail 4 og price 5 til alle produkter i prompten
+def fake_critic_json(prompt):
+    sent_prompts.append(prompt)
+    ids = re.findall(r"^(p\d+):", prompt, re.MULTILINE)
+    return {"products": [{"id": i, "relevance": 4, "detail": 4, "price": 5, "note": "ok"} for i in ids]}
+
+
+def test_product_eval():
+    original = agent_evaluation._generate_critic_json
+    agent_evaluation._generate_critic_json = fake_critic_json
+    try:
+        cache = {}
+
+        # Første kald scorer begge produkter
+        evaluation = evaluate_products(criteria_summary, mock_products, cache=cache, max_results=5)
+        print("First evaluation:", evaluation)
+        assert evaluation["new_products"] == 2
+        assert len(sent_prompts) == 1
+        # To gode produkter fra forskellige butikker skal kunne bestå min_avg_score=4.0
+        assert evaluation["diversity"] == 4
+        assert evaluation["comparison"] == 4
+        scores = [evaluation[k] for k in agent_evaluation.PRODUCT_SCORE_KEYS + agent_evaluation.SET_SCORE_KEYS]
+        assert sum(scores) / len(scores) >= 4.0
+
+        # Andet kald sender kun det nye produkt (dubletter tælles én gang)
+        evaluation = evaluate_products(criteria_summary, mock_products + [mock_products[0], new_product],
+                                       cache=cache, max_results=5)
+        print("Second evaluation:", evaluation)
+        assert evaluation["new_products"] == 1
+        assert len(sent_prompts) == 2
+        assert "Avene" in sent_prompts[-1] and "Vichy" not in sent_prompts[-1]
+        assert evaluation["diversity"] == 5
+
+        # Ændrede kriterier ugyldiggør cachen
+        evaluation = evaluate_products(criteria_summary + "- Brand: Vichy\n", mock_products, cache=cache)
+        assert evaluation["new_products"] == 2
+        assert len(sent_prompts) == 3
+
+        # Samme butik trækker diversity ned, og manglende pris trækker comparison ned
+        same_store = [dict(p, store="Matas") for p in mock_products]
+        same_store[1]["price"] = None
+        evaluation = evaluate_products(criteria_summary, same_store, cache={}, max_results=5)
+        print("Same store evaluation:", evaluation)
+        assert evaluation["diversity"] == 3
+        assert evaluation["comparison"] == 2
+
+        # Scorer som strenge konverteres, ugyldige scorer caches ikke
+        agent_evaluation._generate_critic_json = lambda prompt: {"products": [
+            {"id": "p1", "relevance": "4", "detail": 9, "price": 3},
+            {"id": "p2", "relevance": "høj", "detail": 4, "price": 4},
+        ]}
+        cache = {}
+        evaluation = evaluate_products(criteria_summary, mock_products, cache=cache)
+        print("Invalid scores evaluation:", evaluation)
+        assert evaluation["relevance"] == 4 and evaluation["detail"] == 5
+        assert len(cache) == 1
+        # Kun det gyldige produkt tæller som scoret, og det uscorede nævnes i feedbacken
+        assert evaluation["new_products"] == 1 and evaluation["unscored"] == 1
+        assert "Vichy Aqualia Night" in evaluation["feedback"]
+    finally:
+        agent_evaluation._generate_critic_json = original
+    print("Test done.")
+
+
+if __name__ == "__main__":
+    test_product_eval()
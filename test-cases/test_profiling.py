@@ -0,0 +1,57 @@
+from profiling import profiler, parse_modes
+from rate_limiter import RateLimiter
+import os
+import shutil
+import tempfile
+
+"""
+  This test demonstrates the opt-in profiling hooks (SHOP_PROFILE / --profile).
+
+  Expected behavior:
+  - A session writes a cProfile file (.prof) and a flamegraph-compatible folded file (.folded).
+  - Rate limiter sleeps are attributed to the "ratelimit" category in the time report.
+  - tracemalloc diffs are printed for each snapshot.
+  - Unknown modes from the environment are ignored with a warning instead of raising.
+  """
+
+def test_profiling():
+    assert parse_modes("") == set()
+    assert parse_modes("1") == {"cpu", "mem", "time"}
+    assert parse_modes("all") == {"cpu", "sample", "mem", "time"}
+    assert parse_modes("cpu,foo", strict=False) == {"cpu"}
+
+    output_dir = tempfile.mkdtemp()
+    old_modes, old_dir = set(profiler.modes), profiler.output_dir
+    try:
+        profiler.configure("all", output_dir)  # Samme effekt som --profile all / SHOP_PROFILE=all
+
+        limiter = RateLimiter(max_calls=2, period_sec=0.5)
+        with profiler.session("demo"):
+            data = []
+            for attempt in range(1, 4):
+                limiter.wait_if_needed()
+                data.append([attempt] * 10000)
+                profiler.snapshot(f"attempt {attempt}")
+
+        files = os.listdir(output_dir)
+        print("Profile files:", files)
+        assert any(f.endswith(".prof") for f in files)
+        assert any(f.endswith(".folded") for f in files)
+        assert profiler.timings["ratelimit"] > 0
+
+        # En fejl under opsætningen må ikke efterlade profileren i en indlejret tilstand
+        profiler.configure("time", os.path.join(output_dir, "file"))
+        open(os.path.join(output_dir, "file"), "w").close()
+        try:
+            with profiler.session("broken"):
+                pass
+        except OSError:
+            pass
+        assert profiler._depth == 0
+    finally:
+        profiler.modes, profiler.output_dir = old_modes, old_dir
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print("Test done.")
+
+if __name__ == "__main__":
+    test_profiling()
@@ -3,10 +3,11 @@
 import os # Finder .env filen
 import time
 import requests # Håndterer HTTP‐anmodninger (internet søgninger)
-from typing import List, Dict # Hvilen type af data vi returnerer
+from typing import List, Dict, Optional # Hvilen type af data vi returnerer
 from dotenv import load_dotenv # Håndterer miljøvariabler
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry # Håndterer retry‐strategi for HTTP‐anmodninger
+from profiling import profiler # Måler netværkstid, når profilering er slået til
 
 # Load .env og hent API‐nøglen
 load_dotenv()
@@ -36,7 +37,8 @@ session.mount("http://", adapter)
 
 # Funktion til at søge produkter via SerpAPI's Google Shopping engine 
 # Timeout sat til 15s for at undgå for hurtige read timeouts.
-def search_products(query: str, max_results: int = 5, timeout: int = 15) -> List[Dict]:
+# filters er ekstra SerpAPI‐parametre (f.eks. min_price, max_price, sort_by), så filtreringen sker hos Google
+def search_products(query: str, max_results: int = 5, timeout: int = 15, filters: Optional[Dict] = None) -> List[Dict]:
     
     # Url til SerpAPI Google Shopping søgning
     url = "https://serpapi.com/search"
@@ -48,9 +50,12 @@ def search_products(query: str, max_results: int = 5, timeout: int = 15) -> List
         "api_key": SERPAPI_API_KEY, # Din SerpAPI nøgle
         "num": max_results # Maksimalt antal resultater at returnere (5 sat som standard)
     }
+    if filters:
+        params.update(filters)
 
     try:
-        resp = session.get(url, params=params, timeout=timeout)
+        with profiler.timed("network"):
+            resp = session.get(url, params=params, timeout=timeout)
         resp.raise_for_status()
         data = resp.json()
 